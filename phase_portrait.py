@@ -1,88 +1,113 @@
 import streamlit as st
 import numpy as np
-from scipy.integrate import odeint
+from numba import njit
 import plotly.graph_objects as go
 
+# Upper bound on the points per rendered line
+MAX_PATH_POINTS = 3000
+# How long each frame of the original every-`speed`-th-step animation was shown
+FRAME_DURATION_MS = 10
+# Upper bound on animation frames. go.Figure validates and copies every frame on each
+# rerun, so this caps that cost no matter how the sliders are set.
+MAX_FRAMES = 1000
+
 # --- 1. The Math (Lorenz System) ---
-def lorenz(state, t, sigma, rho, beta):
-    x, y, z = state
-    dxdt = sigma * (y - x)
-    dydt = x * (rho - z) - y
-    dzdt = x * y - beta * z
-    return [dxdt, dydt, dzdt]
+# One RK4 step; compiled so the integrator never calls back into Python
+@njit(inline="always", fastmath=True)
+def _lorenz_rk4_step(x, y, z, sigma, rho, beta, dt):
+    k1x = sigma * (y - x)
+    k1y = x * (rho - z) - y
+    k1z = x * y - beta * z
 
-def main():
-    st.set_page_config(page_title="Lorenz Attractor 3D", layout="wide")
-    st.title("The Butterfly Effect: Lorenz Attractor")
+    x2 = x + 0.5 * dt * k1x
+    y2 = y + 0.5 * dt * k1y
+    z2 = z + 0.5 * dt * k1z
+    k2x = sigma * (y2 - x2)
+    k2y = x2 * (rho - z2) - y2
+    k2z = x2 * y2 - beta * z2
 
-    # --- 2. Sidebar Controls ---
-    with st.sidebar:
-        st.header("Parameters")
-        # Classic values: sigma=10, rho=28, beta=8/3
-        rho = st.slider("Rho (Rayleigh Number)", 0.0, 100.0, 28.0, help="Controls the chaos. Try 10, 28, or 99.")
-        sigma = st.slider("Sigma (Prandtl Number)", 0.0, 50.0, 10.0)
-        beta = st.slider("Beta", 0.0, 5.0, 8.0/3.0)
-        
-        st.header("Simulation Settings")
-        dt = 0.01
-        steps = st.slider("Number of Steps", 1000, 10000, 3000)
-        speed = st.slider("Animation Speed (Skip Frames)", 1, 50, 10, help="Higher = Faster Animation")
+    x3 = x + 0.5 * dt * k2x
+    y3 = y + 0.5 * dt * k2y
+    z3 = z + 0.5 * dt * k2z
+    k3x = sigma * (y3 - x3)
+    k3y = x3 * (rho - z3) - y3
+    k3z = x3 * y3 - beta * z3
+
+    x4 = x + dt * k3x
+    y4 = y + dt * k3y
+    z4 = z + dt * k3z
+    k4x = sigma * (y4 - x4)
+    k4y = x4 * (rho - z4) - y4
+    k4z = x4 * y4 - beta * z4
+
+    x += dt / 6.0 * (k1x + 2.0 * k2x + 2.0 * k3x + k4x)
+    y += dt / 6.0 * (k1y + 2.0 * k2y + 2.0 * k3y + k4y)
+    z += dt / 6.0 * (k1z + 2.0 * k2z + 2.0 * k3z + k4z)
+    return x, y, z
 
-    # --- 3. Compute Trajectory ---
+# Fixed-step RK4 over many initial conditions at once. The state is kept as three
+# contiguous (M,) arrays and every step sweeps across all members, so LLVM can
+# vectorize across members. No threads on purpose: Streamlit sessions run in their
+# own threads, and Numba's default threading layer is not safe to enter from
+# several threads at once.
+# x0, y0, z0 are (M,) arrays; `out` is (N, 3, M)
+@njit(cache=True, fastmath=True)
+def lorenz_rk4_ensemble(sigma, rho, beta, dt, N, x0, y0, z0, out):
+    x = x0.copy()
+    y = y0.copy()
+    z = z0.copy()
+    out[0, 0, :] = x
+    out[0, 1, :] = y
+    out[0, 2, :] = z
+    for i in range(1, N):
+        for j in range(x.shape[0]):
+            x[j], y[j], z[j] = _lorenz_rk4_step(x[j], y[j], z[j], sigma, rho, beta, dt)
+        out[i, 0, :] = x
+        out[i, 1, :] = y
+        out[i, 2, :] = z
+
+# Cached on the physics only, so moving the speed slider doesn't re-solve the ODE.
+# The main path is ensemble member 0: same integrator and t = i*dt grid as its
+# neighbours, so any gap between them is the butterfly effect, not solver error.
+@st.cache_data(max_entries=32)
+def _solve_lorenz(sigma, rho, beta, steps, dt):
     # Initial condition (slightly off-center to ensure movement)
-    initial_state = [1.0, 1.0, 1.0]
-    t = np.arange(0, steps * dt, dt)
-    
-    # Solve ODE
-    sol = odeint(lorenz, initial_state, t, args=(sigma, rho, beta))
-    x, y, z = sol[:, 0], sol[:, 1], sol[:, 2]
-
-    # --- 4. 3D Visualization ---
-    
-    # A. The Static Path (The "Shape")
- 
-    fig = go.Figure()
-    
-    fig.add_trace(go.Scatter3d(
-        x=x, y=y, z=z,
-        mode='lines',
-        name='Attractor Path',
-        # Opacity belongs here, as a property of the Trace
-        opacity=0.4, 
-        # Line dictionary only handles color, width, etc.
-        line=dict(color=z, colorscale='Viridis', width=2)
-    ))
-
-    # B. The Animation (The "Dynamics")
-    # We create frames for the particle moving along the path
-    frames = []
-    # We skip points to make the animation lighter/faster
-    progression_indices = range(0, len(t), speed)
-    
-    for k in progression_indices:
-        frames.append(go.Frame(
-            data=[go.Scatter3d(
-                x=[x[k]], y=[y[k]], z=[z[k]],
-                mode='markers',
-                marker=dict(color='red', size=6, symbol='diamond'),
-                name='Particle'
-            )],
-            name=str(k)
-        ))
-
-    # Add the initial particle
-    fig.add_trace(go.Scatter3d(
-        x=[x[0]], y=[y[0]], z=[z[0]],
-        mode='markers',
-        name='Particle',
-        marker=dict(color='red', size=6, symbol='diamond')
-    ))
+    ones = np.ones(1)
+    sol = np.empty((steps, 3, 1), dtype=np.float64)
+    lorenz_rk4_ensemble(sigma, rho, beta, dt, steps, ones, ones, ones, sol)
+    return sol[:, :, 0]
+
+# Points at equal distances along the path, so the particle neither crawls through
+# the slow stretches nor jumps across the fast ones. Linear interpolation between
+# the fixed i*dt samples is plenty at this resolution.
+def _keyframe_positions(path, n_frames):
+    arc = np.concatenate([[0.0], np.cumsum(np.linalg.norm(np.diff(path, axis=0), axis=1))])
+    targets = np.linspace(0.0, arc[-1], n_frames)
+    return np.array([np.interp(targets, arc, path[:, k]) for k in range(3)])
 
-    # C. Layout & Controls
-    fig.update_layout(
-        title=f"Lorenz Attractor (Rho={rho})",
+# Neighbours of the main initial condition (members 1..size), nudged along x by `spread` each.
+# Only every `stride`-th sample is kept, in float32, since that is all the plot
+# draws; caching the full float64 array would cost up to 15 MB per entry.
+@st.cache_data(max_entries=8)
+def _solve_lorenz_ensemble(sigma, rho, beta, steps, dt, size, stride, spread=1e-3):
+    x0 = 1.0 + spread * np.arange(1, size + 1)
+    y0 = np.ones(size)
+    z0 = np.ones(size)
+    sol = np.empty((steps, 3, size), dtype=np.float64)
+    lorenz_rk4_ensemble(sigma, rho, beta, dt, steps, x0, y0, z0, sol)
+    return sol[::stride].astype(np.float32)
+
+# Everything in the layout except the title and frame duration is constant, so build it
+# once per process for each duration. st.cache_resource hands this same dict to every
+# session, so it must never be mutated; main() takes a shallow copy to add the title.
+@st.cache_resource
+def _make_layout(frame_duration):
+    layout = go.Layout(
         width=900, height=700,
+        # Constant uirevisions let Plotly diff reruns in place and keep the user's camera
+        uirevision='lorenz_v1',
         scene=dict(
+            uirevision='scene',
             xaxis=dict(title='X'),
             yaxis=dict(title='Y'),
             zaxis=dict(title='Z'),
@@ -96,21 +121,135 @@ def main():
             buttons=[
                 dict(label="▶ Play",
                      method="animate",
-                     args=[None, dict(frame=dict(duration=10, redraw=True), fromcurrent=True)]),
+                     args=[None, dict(frame=dict(duration=frame_duration, redraw=True), fromcurrent=True)]),
                 dict(label="⏸ Pause",
                      method="animate",
                      args=[[None], dict(frame=dict(duration=0, redraw=False), mode="immediate", transition=dict(duration=0))])
             ]
         )]
     )
+    return layout.to_plotly_json()
+
+# --- 3D Visualization Pieces ---
+# Each piece is built from validated Plotly objects once, then cached as the plain
+# dict they serialize to. go.Figure copies what it is given, so the shared cached
+# dicts stay untouched.
+
+# Thinning step for drawn lines, rounded up so they stay within MAX_PATH_POINTS
+def _path_stride(steps):
+    return -(-steps // MAX_PATH_POINTS)
+
+# A. The Static Path (The "Shape"), and the particle at its starting point
+@st.cache_resource(max_entries=8)
+def _build_path_traces(sigma, rho, beta, steps, dt):
+    sol = _solve_lorenz(sigma, rho, beta, steps, dt)
+    # Solve in float64, plot in float32: half the bytes on the way to the browser
+    x, y, z = np.ascontiguousarray(sol.T, dtype=np.float32)
+    # Thin the drawn line out; the browser can't tell the difference
+    stride = _path_stride(steps)
+    xs, ys, zs = x[::stride], y[::stride], z[::stride]
+    # Colour by height, pre-bucketed to the colormap's 256 levels (1 byte per vertex)
+    z_span = np.ptp(zs) or 1.0
+    z_color = ((zs - zs.min()) / z_span * 255).astype(np.uint8)
+
+    path = go.Scatter3d(
+        x=xs, y=ys, z=zs,
+        mode='lines',
+        name='Attractor Path',
+        # Opacity belongs here, as a property of the Trace
+        opacity=0.4, 
+        # Line dictionary only handles color, width, etc.
+        line=dict(color=z_color, colorscale='Viridis', cmin=0, cmax=255, width=2)
+    )
+
+    # The initial particle; the animation frames move it
+    particle = go.Scatter3d(
+        x=x[:1], y=y[:1], z=z[:1],
+        mode='markers',
+        name='Particle',
+        marker=dict(color='red', size=6, symbol='diamond')
+    )
+    return path.to_plotly_json(), particle.to_plotly_json()
+
+# Nearby trajectories, drawn as one faint trace with NaN gaps between members.
+# Its own layer, so moving the ensemble slider leaves the main path cached.
+@st.cache_resource(max_entries=8)
+def _build_ensemble_trace(sigma, rho, beta, steps, dt, ensemble_size):
+    ens = _solve_lorenz_ensemble(sigma, rho, beta, steps, dt, ensemble_size, _path_stride(steps))
+    gap = np.full((1, 3, ensemble_size), np.nan, dtype=np.float32)
+    tx, ty, tz = np.concatenate([ens, gap]).transpose(1, 2, 0).reshape(3, -1)
+    return go.Scatter3d(
+        x=tx, y=ty, z=tz,
+        mode='lines',
+        name='Ensemble',
+        opacity=0.15,
+        line=dict(color='white', width=1)
+    ).to_plotly_json()
+
+# B. The Animation (The "Dynamics")
+# Frames are spaced evenly by distance travelled along the solved path, so none are
+# spent creeping through slow stretches. That lets half as many frames as the old
+# every-`speed`-th-step stride cover the path; each is shown twice as long, keeping
+# the total playback time the same (at 50 rather than 100 frames per second).
+# Past MAX_FRAMES the frames are shown longer still, so playback time holds there too.
+def _frame_plan(steps, speed):
+    stride_frames = -(-steps // speed)
+    n_frames = min(max(2, -(-stride_frames // 2)), MAX_FRAMES)
+    return n_frames, round(FRAME_DURATION_MS * stride_frames / n_frames)
+
+# Each frame only restyles the particle's coordinates; the marker style and the
+# other traces are left untouched, so nothing else gets serialized per frame.
+# Written directly as dicts, since each is just three coordinates.
+@st.cache_resource(max_entries=8)
+def _build_frames(sigma, rho, beta, steps, dt, n_frames, particle_idx):
+    sol = _solve_lorenz(sigma, rho, beta, steps, dt)
+    # Plain rounded floats: a 1-element array would be sent as a typed-array object,
+    # which is bigger than the number itself
+    xa, ya, za = np.round(_keyframe_positions(sol, n_frames), 3).tolist()
+    return tuple(
+        dict(
+            data=[dict(type='scatter3d', x=[xa[i]], y=[ya[i]], z=[za[i]])],
+            traces=[particle_idx],
+            name=str(i)
+        )
+        for i in range(len(xa))
+    )
+
+def main():
+    st.set_page_config(page_title="Lorenz Attractor 3D", layout="wide")
+    st.title("The Butterfly Effect: Lorenz Attractor")
+
+    # --- 2. Sidebar Controls ---
+    with st.sidebar:
+        st.header("Parameters")
+        # Classic values: sigma=10, rho=28, beta=8/3
+        rho = st.slider("Rho (Rayleigh Number)", 0.0, 100.0, 28.0, help="Controls the chaos. Try 10, 28, or 99.")
+        sigma = st.slider("Sigma (Prandtl Number)", 0.0, 50.0, 10.0)
+        beta = st.slider("Beta", 0.0, 5.0, 8.0/3.0)
+        
+        st.header("Simulation Settings")
+        dt = 0.01
+        steps = st.slider("Number of Steps", 1000, 10000, 3000)
+        speed = st.slider("Animation Speed", 1, 50, 10, help="Higher = Faster Animation: the particle covers more of the path per frame, in fewer frames")
+        ensemble_size = st.slider("Ensemble Size", 0, 64, 0, help="Extra trajectories started a hair away from the first one.")
+
+    # --- 3. Compute Trajectory & Build Figure ---
+    # Each layer is cached on only the inputs it reads, so e.g. moving the speed
+    # slider rebuilds the frames and nothing else.
+    path, particle = _build_path_traces(sigma, rho, beta, steps, dt)
+    traces = [path, particle]
+    if ensemble_size > 0:
+        traces.append(_build_ensemble_trace(sigma, rho, beta, steps, dt, ensemble_size))
+    n_frames, frame_duration = _frame_plan(steps, speed)
+    frames = _build_frames(sigma, rho, beta, steps, dt, n_frames, particle_idx=1)
 
-    # Attach frames to figure
-    fig.frames = frames
+    layout = dict(_make_layout(frame_duration), title=f"Lorenz Attractor (Rho={rho})")
+    fig = go.Figure(data=traces, layout=layout, frames=list(frames))
 
     # Show Plot
     col1, col2 = st.columns([3, 1])
     with col1:
-        st.plotly_chart(fig, use_container_width=True)
+        st.plotly_chart(fig, use_container_width=True, key='lorenz_plot')
     with col2:
         st.markdown("### What are we seeing?")
         st.info("""